@@ -4,9 +4,17 @@
 # - Enter i input => JS klikker på "Sjekk svar"-knappen
 # - Ingen programmatisk on_change, så ingen "første Enter" bug
 # - Riktig konverteringsretning, fasit som tall, stabilt kategori/bytte, standard Lengde
+# - Oppgavemaler (sammensatte enheter, summer, sammenligning) kompileres én gang ved oppstart
+# - Felles resultattavle for alle økter (oppdateres live via fragment med run_every)
 # Kjør: streamlit run malenheter_trening.py
 
 import random
+import threading
+import time
+import uuid
+import heapq
+import re
+from string import Formatter
 from datetime import datetime, timedelta
 import streamlit as st
 import streamlit.components.v1 as components
@@ -58,19 +66,220 @@ def random_value(difficulty: str) -> Decimal:
     else:  # Blandet
         return random_value("Hele tall") if random.random() < 0.5 else random_value("Desimaltall")
 
-def build_conversion_task(category: str, allowed_units, difficulty: str):
+# ---------- Oppgavemaler ----------
+# Hver mal: "tekst" med feltene {vN} (tall) og {uN} (enhet), og "svar" som
+# ledd "vN uN" med + / - og målenhet etter "->". Valgfritt:
+# - "hele": felt som trekkes som små hele tall
+# - "synkende": enheter som skal stå fra største til minste (som "2 km 350 m")
+# - "rest": "vN < uA/uB <= M" – vN holdes under forholdet mellom enhetene,
+#   og enhetsparet velges slik at forholdet er høyst M
+# - "positiv": bytt om leddene slik at svaret ikke blir negativt
+TASK_TEMPLATES = {
+    "Konvertering": {
+        "tekst": "Konverter: {v1} {u1} → {u2} = ?",
+        "svar": "v1 u1 -> u2",
+    },
+    "Sammensatt": {
+        "tekst": "Konverter: {v1} {u1} {v2} {u2} → {u3} = ?",
+        "svar": "v1 u1 + v2 u2 -> u3",
+        "hele": "v1 v2",
+        "synkende": "u1 u2",
+        "rest": "v2 < u1/u2 <= 1000",
+    },
+    "Sum": {
+        "tekst": "Regn ut i {u3}: {v1} {u1} + {v2} {u2} = ?",
+        "svar": "v1 u1 + v2 u2 -> u3",
+    },
+    "Sammenligning": {
+        "tekst": "Hvor mye mer er {v1} {u1} enn {v2} {u2}? Svar i {u3}.",
+        "svar": "v1 u1 - v2 u2 -> u3",
+        "positiv": True,
+    },
+}
+
+TERM_RE = re.compile(r"^([+-])?\s*(v\d+)\s+(u\d+)$")
+REST_RE = re.compile(r"^(v\d+)\s*<\s*(u\d+)\s*/\s*(u\d+)\s*<=\s*(\d+)$")
+
+def compile_template(name: str, spec: dict) -> dict:
+    # Tolkes og valideres én gang; resultatet brukes for hver oppgave
+    parts = []
+    fields = set()
+    for literal, field, fmt_spec, conv in Formatter().parse(spec["tekst"]):
+        if fmt_spec or conv:
+            raise ValueError(f"{name}: formatering støttes ikke i {{{field}}}")
+        if field is not None and not re.fullmatch(r"[vu]\d+", field):
+            raise ValueError(f"{name}: ukjent felt {{{field}}}")
+        parts.append((literal, field))
+        if field is not None:
+            fields.add(field)
+
+    expr, sep, target = spec["svar"].partition("->")
+    target = target.strip()
+    if not sep or target not in fields:
+        raise ValueError(f"{name}: svar mangler målenhet i teksten: {spec['svar']!r}")
+    terms = []
+    for raw in re.findall(r"[+-]?[^+-]+", expr):
+        m = TERM_RE.match(raw.strip())
+        if not m:
+            raise ValueError(f"{name}: ugyldig ledd {raw.strip()!r}")
+        sign, v, u = m.groups()
+        if v not in fields or u not in fields:
+            raise ValueError(f"{name}: leddet {v} {u} finnes ikke i teksten")
+        terms.append((-1 if sign == "-" else 1, v, u))
+    if not terms:
+        raise ValueError(f"{name}: svar uten ledd")
+
+    values = [t[1] for t in terms]
+    units = [t[2] for t in terms]
+    if len(set(units)) != len(units):
+        raise ValueError(f"{name}: leddene må ha ulike enheter")
+    if target in units:
+        raise ValueError(f"{name}: målenheten må være et eget felt")
+    unused = fields - set(values) - set(units) - {target}
+    if unused:
+        raise ValueError(f"{name}: feltene {sorted(unused)} brukes ikke i svaret")
+
+    whole = spec.get("hele", "").split()
+    descending = spec.get("synkende", "").split()
+    for f in whole + descending:
+        if f not in values + units:
+            raise ValueError(f"{name}: {f} brukes ikke i svaret")
+    rest = None
+    if "rest" in spec:
+        m = REST_RE.match(spec["rest"].strip())
+        if not m or m.group(1) not in values or m.group(2) not in units or m.group(3) not in units:
+            raise ValueError(f"{name}: ugyldig rest {spec['rest']!r}")
+        v, big, small, max_ratio = m.groups()
+        rest = (v, big, small, int(max_ratio))
+    positive = bool(spec.get("positiv", False))
+    if positive and len(terms) != 2:
+        raise ValueError(f"{name}: positiv krever nøyaktig to ledd")
+
+    return {
+        "name": name, "parts": parts, "terms": terms, "target": target,
+        "values": values, "units": units, "whole": set(whole),
+        "descending": descending, "rest": rest, "positive": positive,
+    }
+
+def unit_scales(category: str) -> dict:
+    # Riktig retning: (fra, til) -> * 10^(exp_fra - exp_til)
+    exps = EXPONENTS[category]
+    return {(a, b): pow10(exps[a] - exps[b]) for a in exps for b in exps}
+
+@st.cache_resource
+def compiled_templates():
+    templates = {name: compile_template(name, spec) for name, spec in TASK_TEMPLATES.items()}
+    scales = {category: unit_scales(category) for category in UNITS}
+    return templates, scales
+
+def instantiate_template(tpl: dict, scales: dict, category: str, allowed_units, difficulty: str):
     units = [u for u in UNITS[category] if not allowed_units or u in allowed_units]
     if len(units) < 2:
         units = UNITS[category]
-    u_from, u_to = random.sample(units, 2)
-    value = random_value(difficulty)
-    exp_from = EXPONENTS[category][u_from]
-    exp_to = EXPONENTS[category][u_to]
-    # Riktig retning: fra -> til = * 10^(exp_from - exp_to)
-    exp_diff = exp_from - exp_to
-    correct = value * pow10(exp_diff)
-    text = f"Konverter: {fmt(value)} {u_from} → {u_to} = ?"
-    return text, correct, u_from, u_to, value
+    exps = EXPONENTS[category]
+
+    f = {}
+    if tpl["rest"]:
+        # Enhetspar som i "2 km 350 m": stor enhet først, forhold høyst max_ratio
+        _, big, small, max_ratio = tpl["rest"]
+        pairs = [(a, b) for a in units for b in units if 1 < scales[(a, b)] <= max_ratio]
+        if not pairs:
+            pairs = [(a, b) for a in UNITS[category] for b in UNITS[category]
+                     if 1 < scales[(a, b)] <= max_ratio]
+        f[big], f[small] = random.choice(pairs)
+    free = [u for u in tpl["units"] if u not in f]
+    pool = [u for u in units if u not in f.values()]
+    if len(pool) < len(free):
+        pool = [u for u in UNITS[category] if u not in f.values()]
+    f.update(zip(free, random.sample(pool, len(free))))
+    if tpl["descending"]:
+        ordered = sorted((f[u] for u in tpl["descending"]), key=lambda u: -exps[u])
+        f.update(zip(tpl["descending"], ordered))
+    others = [u for u in units if u not in f.values()] if len(tpl["units"]) == 1 else units
+    f[tpl["target"]] = random.choice(others or UNITS[category])
+
+    for v in tpl["values"]:
+        f[v] = Decimal(random.randint(1, 99)) if v in tpl["whole"] else random_value(difficulty)
+    if tpl["rest"]:
+        v, big, small, _ = tpl["rest"]
+        f[v] = Decimal(random.randint(1, int(scales[(f[big], f[small])]) - 1))
+
+    target = f[tpl["target"]]
+    answer = sum(sign * f[v] * scales[(f[u], target)] for sign, v, u in tpl["terms"])
+    if tpl["positive"] and answer < 0:
+        (_, v1, u1), (_, v2, u2) = tpl["terms"]
+        f[v1], f[u1], f[v2], f[u2] = f[v2], f[u2], f[v1], f[u1]
+        answer = -answer
+
+    text = "".join(lit + (fmt(f[fld]) if fld and fld[0] == "v" else (f[fld] if fld else ""))
+                   for lit, fld in tpl["parts"])
+    return text, answer, f
+
+def build_task(category: str, allowed_units, difficulty: str, families):
+    templates, scales = compiled_templates()
+    tpl = templates[random.choice([n for n in families if n in templates] or ["Konvertering"])]
+    text, answer, f = instantiate_template(tpl, scales[category], category, allowed_units, difficulty)
+    _, v1, u1 = tpl["terms"][0]
+    return text, answer, f[u1], f[tpl["target"]], f[v1]
+
+# ---------- Resultattavle (felles for alle økter i prosessen) ----------
+# Trådsikker oversikt over poeng per nettleser; oppdatering ved hvert svar er O(1).
+# Fragmentet fornyer tidsstempelet så lenge siden er åpen, så bare rader fra
+# lukkede nettlesere blir gamle og fjernes.
+LEADERBOARD_IDLE_SECONDS = 10 * 60
+
+class Leaderboard:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._scores = {}  # player_id -> (navn, riktige, forsøkt, sist sett)
+
+    def update(self, player_id: str, name: str, correct: int, tried: int):
+        with self._lock:
+            self._scores[player_id] = (name, correct, tried, time.monotonic())
+
+    def touch(self, player_id: str):
+        with self._lock:
+            row = self._scores.get(player_id)
+            if row is not None:
+                self._scores[player_id] = row[:3] + (time.monotonic(),)
+
+    def top(self, n: int = 10):
+        cutoff = time.monotonic() - LEADERBOARD_IDLE_SECONDS
+        with self._lock:
+            stale = [k for k, r in self._scores.items() if r[3] < cutoff]
+            for k in stale:
+                del self._scores[k]
+            rows = [r[:3] for r in self._scores.values()]
+        return heapq.nsmallest(n, rows, key=lambda r: (-r[1], r[2], r[0]))
+
+@st.cache_resource
+def get_leaderboard() -> Leaderboard:
+    return Leaderboard()
+
+def player_name() -> str:
+    name = (st.session_state.get("player_name") or "").strip()
+    return name or f"Elev {st.session_state.player_id[:4]}"
+
+def publish_score():
+    # Raden eies av nettleseren (player_id); navnet er bare visningstekst
+    get_leaderboard().update(
+        st.session_state.player_id, player_name(),
+        st.session_state.get("correct_count", 0), st.session_state.get("tried", 0)
+    )
+
+@st.fragment(run_every=5)
+def leaderboard_fragment():
+    board = get_leaderboard()
+    board.touch(st.session_state.player_id)
+    rows = board.top(10)
+    st.subheader("Resultattavle")
+    if not rows:
+        st.caption("Ingen resultater ennå.")
+        return
+    st.table([
+        {"#": i, "Navn": name, "Riktige": corr, "Forsøkt": tried}
+        for i, (name, corr, tried) in enumerate(rows, start=1)
+    ])
 
 # ---------- State helpers ----------
 def queue_new_task():
@@ -90,6 +299,7 @@ def reset_session():
         minutes = st.session_state.get("minutes", 2)
         st.session_state.end_time = (datetime.utcnow() + timedelta(minutes=minutes)).timestamp()
         st.session_state.pop("remaining", None)
+    publish_score()
     queue_new_task()
 
 def focus_answer_input():
@@ -115,6 +325,12 @@ st.title("Trening på målenheter (SI) · Enter-flyt")
 
 DEFAULT_CATEGORY = "Lengde"
 
+# Fast id per nettleser i URL-en, så en omlasting beholder samme rad på resultattavla
+if "player_id" not in st.session_state:
+    if "spiller" not in st.query_params:
+        st.query_params["spiller"] = uuid.uuid4().hex
+    st.session_state.player_id = st.query_params["spiller"]
+
 with st.sidebar:
     st.header("Innstillinger")
     st.session_state.mode = st.selectbox("Øktmodus", ["Antall oppgaver", "Tid"], index=0)
@@ -136,6 +352,8 @@ with st.sidebar:
     current_units = st.session_state.get(units_key, all_units) or all_units
 
     st.session_state.difficulty = st.selectbox("Talltype", ["Hele tall","Desimaltall","Blandet"], index=2, key="diff_sel")
+    st.multiselect("Oppgavetyper", list(TASK_TEMPLATES), default=["Konvertering"], key="families")
+    current_families = st.session_state.get("families") or ["Konvertering"]
 
     if st.session_state.mode == "Antall oppgaver":
         qcount = st.number_input("Antall oppgaver i økt", min_value=1, max_value=200, value=20, step=1, key="qcount")
@@ -162,10 +380,11 @@ for key, default in [
 
 # Queue processing BEFORE UI
 if st.session_state.spawn_new_task:
-    text, correct, u_from, u_to, v = build_conversion_task(
+    text, correct, u_from, u_to, v = build_task(
         st.session_state.category,
         current_units,
-        st.session_state.difficulty
+        st.session_state.difficulty,
+        current_families
     )
     st.session_state.task_text = text
     st.session_state.correct = correct
@@ -179,10 +398,11 @@ if st.session_state.spawn_new_task:
 
 # First task
 if st.session_state.task_text is None:
-    text, correct, u_from, u_to, v = build_conversion_task(
+    text, correct, u_from, u_to, v = build_task(
         st.session_state.category,
         current_units,
-        st.session_state.difficulty
+        st.session_state.difficulty,
+        current_families
     )
     st.session_state.task_text = text
     st.session_state.correct = correct
@@ -272,6 +492,7 @@ else:
         else:
             st.session_state.last_feedback = "wrong"
             st.session_state.focus_answer = True
+        publish_score()
 
     # Knapper
     colA, colB = st.columns([1,1])
@@ -311,4 +532,9 @@ if st.session_state.get("focus_answer", False):
     focus_answer_input()
     st.session_state["focus_answer"] = False
 
+st.divider()
+leaderboard_fragment()
+# Navnefeltet ligger etter svarfeltet, så JS-en over fortsatt finner svarfeltet først
+st.text_input("Navn på resultattavla", key="player_name", on_change=publish_score)
+
 st.caption("Skriv bare tallet. Du kan bruke komma eller punktum som desimaltegn.")
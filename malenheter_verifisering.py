@@ -0,0 +1,324 @@
+# Målenheter – differensiell korrekthetstest av de tre app-variantene
+# - Henter fmt/parse_user/pow10/random_value og oppgavebyggeren direkte fra
+#   hvert skript (via AST, uten å starte Streamlit-appen)
+# - Kjører mange genererte oppgaver i en prosesspool og sammenligner alt mot
+#   en eksakt referanse (Fraction), inkl. fmt -> parse_user rundtur
+# - Oppgavemalene i trening-varianten sjekkes mot samme referanse
+# - Nye raske varianter av omgjøringen legges i RASKE_VEIER og sjekkes likt
+# - Rapporterer gjennomstrømning og første avvik (reproduserbart via seed)
+#
+# Kjør: python malenheter_verifisering.py --antall 20000000
+
+import argparse
+import ast
+import os
+import random
+import re
+import sys
+import time
+import types
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal
+from fractions import Fraction
+
+HER = os.path.dirname(os.path.abspath(__file__))
+
+VARIANTER = {
+    "trening": "malenheter_trening.py",
+    "simple":  "malenheter_trening_simple.py",
+    "stabil":  "malenheter_trening_stabil.py",
+}
+
+# Navn som hentes ut av hvert skript (alt annet, inkl. Streamlit-UI, hoppes over)
+HENT_NAVN = {
+    "fmt", "parse_user", "pow10", "random_value",
+    "make_task", "new_task",
+    "UNITS", "EXPONENTS", "EXP",
+    "TASK_TEMPLATES", "TERM_RE", "REST_RE", "compile_template", "unit_scales",
+    "compiled_templates", "instantiate_template", "build_task",
+}
+
+# ---------- Eksakt referanse ----------
+REFERANSE_EKSPONENTER = {
+    "Lengde": {"mm": -3, "cm": -2, "dm": -1, "m": 0, "km": 3},
+    "Masse":  {"mg": -3, "g": 0, "hg": 2, "kg": 3, "tonn": 6},
+    "Volum":  {"ml": -3, "cl": -2, "dl": -1, "l": 0},
+}
+
+def ref_convert(value: Decimal, u_from: str, u_to: str, category: str = "Lengde") -> Fraction:
+    exps = REFERANSE_EKSPONENTER[category]
+    return Fraction(value) * Fraction(10) ** (exps[u_from] - exps[u_to])
+
+def ref_fmt(x: Fraction) -> str:
+    # Eksakt desimalskriving (nevneren er alltid 2^a * 5^b), komma som skilletegn
+    sign = "-" if x < 0 else ""
+    x = abs(x)
+    whole, rest = divmod(x.numerator, x.denominator)
+    digits = []
+    while rest:
+        rest *= 10
+        d, rest = divmod(rest, x.denominator)
+        digits.append(str(d))
+    return sign + str(whole) + ("," + "".join(digits) if digits else "")
+
+TASK_RE = re.compile(r"^Konverter: (\S+) (\S+) → (\S+) = \?$")
+
+# ---------- Raske veier (kandidater) ----------
+# Signatur: (value, exp_diff) -> Decimal. Sjekkes mot referansen på hver oppgave.
+def scaleb_path(value: Decimal, exp_diff: int) -> Decimal:
+    return value.scaleb(exp_diff)
+
+RASKE_VEIER = {
+    "scaleb": scaleb_path,
+}
+
+# ---------- Lasting av variantene ----------
+def load_variant(filename: str) -> dict:
+    path = os.path.join(HER, filename)
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read(), filename=path)
+
+    body = []
+    for node in tree.body:
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            mods = [node.module] if isinstance(node, ast.ImportFrom) else [a.name for a in node.names]
+            if not any(m and m.startswith("streamlit") for m in mods):
+                body.append(node)
+        elif isinstance(node, ast.FunctionDef) and node.name in HENT_NAVN:
+            node.decorator_list = []  # f.eks. @st.cache_resource
+            body.append(node)
+        elif isinstance(node, ast.Assign) and any(
+            isinstance(t, ast.Name) and t.id in HENT_NAVN for t in node.targets
+        ):
+            body.append(node)
+        elif isinstance(node, ast.Assign) and "getcontext" in ast.unparse(node):
+            body.append(node)  # getcontext().prec = 28
+
+    ns = {"__name__": f"variant_{os.path.splitext(filename)[0]}", "__file__": path}
+    # new_task i simple-varianten skriver til st.session_state
+    ns["st"] = types.SimpleNamespace(session_state={})
+    exec(compile(ast.Module(body=body, type_ignores=[]), path, "exec"), ns)
+
+    # Fang opp startverdien som oppgavebyggeren trekker
+    inner = ns["random_value"]
+    def recording_random_value(*args):
+        ns["_last_value"] = inner(*args)
+        return ns["_last_value"]
+    ns["random_value"] = recording_random_value
+    ns["_inner_random_value"] = inner
+
+    # Malene kompileres én gang per prosess, som med @st.cache_resource i appen
+    if "compiled_templates" in ns:
+        compiled = ns["compiled_templates"]()
+        ns["compiled_templates"] = lambda: compiled
+    return ns
+
+def variant_exponents(ns: dict) -> dict:
+    if "EXPONENTS" in ns:
+        return ns["EXPONENTS"]
+    return {"Lengde": ns["EXP"]}
+
+def variant_task(ns: dict, category: str, difficulty: str):
+    # Returnerer (text, correct, value) fra variantens egen oppgavebygger
+    if "build_task" in ns:
+        text, correct, _, _, value = ns["build_task"](category, None, difficulty, ["Konvertering"])
+        return text, correct, value
+    if "make_task" in ns:
+        correct, text = ns["make_task"]()
+        return text, correct, ns["_last_value"]
+    ns["new_task"]()
+    state = ns["st"].session_state
+    return state["task_text"], state["correct"], ns["_last_value"]
+
+# ---------- Sjekk av én oppgave ----------
+DIFFICULTIES = ["Hele tall", "Desimaltall", "Blandet"]
+
+def check_task(name: str, ns: dict, category: str, difficulty: str):
+    text, correct, value = variant_task(ns, category, difficulty)
+    m = TASK_RE.match(text)
+    if not m:
+        return {"sjekk": "oppgavetekst", "tekst": text}
+    shown, u_from, u_to = m.groups()
+    if u_from == u_to or u_from not in REFERANSE_EKSPONENTER[category] or u_to not in REFERANSE_EKSPONENTER[category]:
+        return {"sjekk": "enheter", "tekst": text}
+
+    ref = ref_convert(value, u_from, u_to, category)
+    base = {"tekst": text, "verdi": str(value), "fasit_ref": ref_fmt(ref)}
+
+    if shown != ref_fmt(Fraction(value)):
+        return {"sjekk": "fmt(verdi)", "fikk": shown, **base}
+    if Fraction(correct) != ref:
+        return {"sjekk": "fasit", "fikk": str(correct), **base}
+
+    # fmt -> parse_user rundtur, på tvers av alle varianter
+    shown_correct = ns["fmt"](correct)
+    if shown_correct != ref_fmt(ref):
+        return {"sjekk": "fmt(fasit)", "fikk": shown_correct, **base}
+    for other_name, other in _LOADED.items():
+        if Fraction(other["parse_user"](shown_correct)) != ref:
+            return {"sjekk": f"parse_user[{other_name}](fmt)", "fikk": shown_correct, **base}
+        if other["fmt"](correct) != shown_correct:
+            return {"sjekk": f"fmt[{other_name}]", "fikk": other["fmt"](correct), **base}
+
+    exp_diff = REFERANSE_EKSPONENTER[category][u_from] - REFERANSE_EKSPONENTER[category][u_to]
+    for other_name, other in _LOADED.items():
+        if Fraction(value * other["pow10"](exp_diff)) != ref:
+            return {"sjekk": f"pow10[{other_name}]", "fikk": str(value * other["pow10"](exp_diff)), **base}
+    for fast_name, fast in RASKE_VEIER.items():
+        got = fast(value, exp_diff)
+        if Fraction(got) != ref:
+            return {"sjekk": f"rask vei {fast_name}", "fikk": str(got), **base}
+        if ns["fmt"](got) != shown_correct or ns["parse_user"](ns["fmt"](got)) != correct:
+            return {"sjekk": f"rask vei {fast_name} (fmt)", "fikk": ns["fmt"](got), **base}
+    return None
+
+# Uavhengig fasit for hver mal i appen: tekstmønster og regnestykke skrevet
+# direkte her, ikke hentet fra compile_template. Nye maler må legges til her.
+def _konvertering(v1, u1, t):
+    return [(1, v1, u1)], t
+
+def _sammensatt(v1, u1, v2, u2, t):
+    return [(1, v1, u1), (1, v2, u2)], t
+
+def _sum(t, v1, u1, v2, u2):
+    return [(1, v1, u1), (1, v2, u2)], t
+
+def _sammenligning(v1, u1, v2, u2, t):
+    return [(1, v1, u1), (-1, v2, u2)], t
+
+MAL_REFERANSE = {
+    "Konvertering":  (re.compile(r"^Konverter: (\S+) (\S+) → (\S+) = \?$"), _konvertering),
+    "Sammensatt":    (re.compile(r"^Konverter: (\S+) (\S+) (\S+) (\S+) → (\S+) = \?$"), _sammensatt),
+    "Sum":           (re.compile(r"^Regn ut i (\S+): (\S+) (\S+) \+ (\S+) (\S+) = \?$"), _sum),
+    "Sammenligning": (re.compile(r"^Hvor mye mer er (\S+) (\S+) enn (\S+) (\S+)\? Svar i (\S+)\.$"), _sammenligning),
+}
+
+def ref_parse(s: str) -> Fraction:
+    return Fraction(s.replace(",", "."))
+
+def check_template_task(ns: dict, category: str, difficulty: str):
+    # Oppgavemalene (kun trening-varianten) mot eksakt referanse
+    templates, scales = ns["compiled_templates"]()
+    name = random.choice(list(templates))
+    text, answer, _ = ns["instantiate_template"](templates[name], scales[category], category, None, difficulty)
+    base = {"mal": name, "tekst": text}
+    if name not in MAL_REFERANSE:
+        return {"sjekk": "mal uten referanse", **base}
+    pattern, formula = MAL_REFERANSE[name]
+    m = pattern.match(text)
+    if not m:
+        return {"sjekk": "maltekst", "fikk": text, **base}
+    terms, target = formula(*m.groups())
+
+    exps = REFERANSE_EKSPONENTER[category]
+    units = [u for _, _, u in terms]
+    if any(u not in exps for u in units + [target]) or len(set(units)) != len(units) \
+            or (len(terms) == 1 and units[0] == target):
+        return {"sjekk": "malenheter", **base}
+    for _, v, _ in terms:
+        if ref_fmt(ref_parse(v)) != v:
+            return {"sjekk": "fmt(malverdi)", "fikk": v, "verdi_ref": ref_fmt(ref_parse(v)), **base}
+    ref = sum(sign * ref_parse(v) * Fraction(10) ** (exps[u] - exps[target]) for sign, v, u in terms)
+    base["fasit_ref"] = ref_fmt(ref)
+
+    if Fraction(answer) != ref:
+        return {"sjekk": "malfasit", "fikk": str(answer), **base}
+    if name == "Sammenligning" and ref < 0:
+        return {"sjekk": "mal positiv", "fikk": str(answer), **base}
+    if name == "Sammensatt":
+        (_, v1, u1), (_, v2, u2) = terms
+        # Som "2 km 350 m": større enhet først, høyst tre dekader mellom enhetene
+        if not 0 < exps[u1] - exps[u2] <= 3 or ref_parse(v1).denominator != 1 \
+                or not 0 < ref_parse(v2) < 10 ** (exps[u1] - exps[u2]):
+            return {"sjekk": "mal sammensatt", **base}
+    if Fraction(ns["parse_user"](ns["fmt"](answer))) != ref or ns["fmt"](answer) != ref_fmt(ref):
+        return {"sjekk": "malfasit (fmt)", "fikk": ns["fmt"](answer), **base}
+    return None
+
+# ---------- Prosesspool ----------
+_LOADED = {}
+
+def init_worker():
+    for name, filename in VARIANTER.items():
+        _LOADED[name] = load_variant(filename)
+
+def check_domain():
+    # Enhetene og eksponentene i hver variant skal matche referansen
+    problems = []
+    for name, ns in _LOADED.items():
+        for category, exps in variant_exponents(ns).items():
+            if exps != REFERANSE_EKSPONENTER[category]:
+                problems.append(f"{name}: eksponenter for {category} avviker: {exps}")
+        for tpl in set(ns.get("TASK_TEMPLATES", ())) - set(MAL_REFERANSE):
+            problems.append(f"{name}: malen {tpl} mangler referanse i MAL_REFERANSE")
+    return problems
+
+def run_chunk(args):
+    seed, start, count = args
+    random.seed(seed)
+    names = list(_LOADED)
+    categories = list(REFERANSE_EKSPONENTER)
+    first = None
+    failures = 0
+    for i in range(start, start + count):
+        name = names[i % len(names)]
+        ns = _LOADED[name]
+        if "EXPONENTS" in ns:
+            category = categories[(i // len(names)) % len(categories)]
+        else:
+            category = "Lengde"
+        difficulty = DIFFICULTIES[(i // len(names)) % len(DIFFICULTIES)]
+        try:
+            problem = check_task(name, ns, category, difficulty)
+            if problem is None and "compiled_templates" in ns:
+                problem = check_template_task(ns, category, difficulty)
+        except Exception as e:
+            problem = {"sjekk": "unntak", "feil": repr(e)}
+        if problem is not None:
+            failures += 1
+            if first is None:
+                first = {"indeks": i, "seed": seed, "variant": name, "kategori": category}
+                if "EXPONENTS" in ns:  # simple/stabil bruker ikke talltype
+                    first["talltype"] = difficulty
+                first.update(problem)
+    return count, failures, first
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Differensiell korrekthetstest av målenhet-appene.")
+    p.add_argument("--antall", type=int, default=1_000_000, help="antall oppgaver totalt")
+    p.add_argument("--prosesser", type=int, default=os.cpu_count() or 1)
+    p.add_argument("--bit", type=int, default=20_000, help="oppgaver per arbeidspakke")
+    p.add_argument("--seed", type=int, default=0)
+    a = p.parse_args(argv)
+
+    init_worker()
+    problems = check_domain()
+    for msg in problems:
+        print(f"AVVIK (domene): {msg}")
+
+    chunks = [
+        (a.seed * 1_000_003 + k, start, min(a.bit, a.antall - start))
+        for k, start in enumerate(range(0, a.antall, a.bit))
+    ]
+    done = failures = 0
+    first = None
+    t0 = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=a.prosesser, initializer=init_worker) as pool:
+        # map bevarer rekkefølgen, så første avvik er det med lavest indeks
+        for count, fails, chunk_first in pool.map(run_chunk, chunks):
+            done += count
+            failures += fails
+            if first is None and chunk_first is not None:
+                first = chunk_first
+    elapsed = time.perf_counter() - t0
+
+    rate = done / elapsed if elapsed > 0 else float("inf")
+    print(f"Oppgaver: {done}  Avvik: {failures}  Tid: {elapsed:.1f} s  ({rate:,.0f} oppgaver/s, {a.prosesser} prosesser)")
+    if first is not None:
+        print("Første avvik:")
+        for k, v in first.items():
+            print(f"  {k}: {v}")
+    return 1 if (failures or problems) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())